@@ -7,6 +7,8 @@ import re
 import io
 import os
 import json as json_lib
+import threading
+import uuid
 from werkzeug.utils import secure_filename
 
 # --------------------------------------------------------------------------------------
@@ -27,6 +29,7 @@ PERSIST_RESULTS = os.path.join(PERSIST_DIR, 'results.json')
 PERSIST_ORIG = os.path.join(PERSIST_DIR, 'original_data.json')
 PERSIST_TXN = os.path.join(PERSIST_DIR, 'transactions_detail.json')
 PERSIST_META = os.path.join(PERSIST_DIR, 'meta.json')
+PERSIST_EDITS = os.path.join(PERSIST_DIR, 'edits.jsonl')
 
 # Custom rules file
 CUSTOM_RULES_FILE = 'custom_rules.json'
@@ -404,7 +407,9 @@ def upload_file():
         total_amt = float(df['Amount'].sum())
         total_tds_base = float(results.loc[results['TDS/TCS Applicable']=='Yes','Total Amount'].sum())
 
+        upload_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
         session.clear()
+        session['upload_id'] = upload_id
         session['results'] = results.to_json(orient='records')
         session['original_data'] = df.to_json(orient='records')
         session['transactions_detail'] = tx_detail.to_json(orient='records')
@@ -414,7 +419,8 @@ def upload_file():
         with open(PERSIST_RESULTS, 'w', encoding='utf-8') as f: f.write(results.to_json(orient='records'))
         with open(PERSIST_ORIG, 'w', encoding='utf-8') as f: f.write(df.to_json(orient='records'))
         with open(PERSIST_TXN, 'w', encoding='utf-8') as f: f.write(tx_detail.to_json(orient='records'))
-        with open(PERSIST_META, 'w', encoding='utf-8') as f: json_lib.dump({'total_amount': total_amt}, f)
+        with open(PERSIST_META, 'w', encoding='utf-8') as f: json_lib.dump({'total_amount': total_amt, 'upload_id': upload_id}, f)
+        if os.path.exists(PERSIST_EDITS): os.remove(PERSIST_EDITS)
 
         return jsonify({
             'success': True,
@@ -431,6 +437,175 @@ def upload_file():
 # --------------------------------------------------------------------------------------
 # Inline edits (party-level)
 # --------------------------------------------------------------------------------------
+# persist/results.json keeps the analyzed baseline; edits are appended to
+# persist/edits.jsonl (one batch per line) and replayed on top when needed.
+# Each logged edit records the row positions it touched with their old and
+# new column values, so replay and undo never re-run validation.
+EDIT_COLUMNS = {'rate': 'Rate', 'section': 'Section', 'threshold': 'Threshold', 'applicable': 'Applicability Override'}
+OVERRIDE_COL = EDIT_COLUMNS['applicable']
+APPLICABILITY = {'yes': 'Yes', 'no': 'No', 'auto': ''}
+
+class EditError(ValueError):
+    """Raised when a batch of edits fails validation; nothing is applied."""
+    def __init__(self, errors, missing=()):
+        super().__init__('; '.join(f'Edit {i}: {msg}' for i, msg in errors))
+        self.errors = errors
+        self.missing = list(missing)
+
+EDIT_LOG_LOCK = threading.Lock()
+
+def load_edit_log(upload_id):
+    batches = []
+    if os.path.exists(PERSIST_EDITS):
+        with open(PERSIST_EDITS, 'r', encoding='utf-8') as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    batches.append(json_lib.loads(line))
+                except ValueError as e:
+                    # e.g. a half-written line after a crash; skip rather than fail every download
+                    print(f"Skipping unreadable edit log line {n}: {e}")
+    return [b for b in batches if isinstance(b, dict) and b.get('upload_id') == upload_id]
+
+def append_edit_log(batch):
+    line = (json_lib.dumps(batch, ensure_ascii=False) + '\n').encode('utf-8')
+    with EDIT_LOG_LOCK, open(PERSIST_EDITS, 'ab+') as f:
+        # Start on a fresh line if a previous write was cut off mid-line
+        if f.seek(0, os.SEEK_END) and (f.seek(-1, os.SEEK_END), f.read(1))[1] != b'\n':
+            line = b'\n' + line
+        f.write(line)
+
+def _assign(results, column, pos, values):
+    """Write values into results[column] at row positions, widening the dtype if needed."""
+    vals = list(values) if isinstance(values, (list, np.ndarray)) else [values]
+    kind = results[column].dtype.kind
+    if kind != 'O' and any(isinstance(v, str) or v is None for v in vals):
+        results[column] = results[column].astype(object)
+    elif kind in 'iub' and any(isinstance(v, float) for v in vals):
+        results[column] = results[column].astype(float)
+    results.iloc[pos, results.columns.get_loc(column)] = values
+
+def _row_values(results, column, pos):
+    if column not in results.columns:
+        return [None] * len(pos)
+    return [None if pd.isna(v) else v for v in results[column].iloc[pos].tolist()]
+
+def recompute_rows(results, pos):
+    """Recompute applicability/amount for the given row positions only."""
+    rows = results.iloc[pos]
+    total = rows['Total Amount'].astype(float)
+    threshold = pd.to_numeric(rows['Threshold'], errors='coerce').fillna(0)
+    per_bill = rows['Per Bill Breach'] == 'Yes'
+    annual = total >= threshold
+    override = rows[OVERRIDE_COL] if OVERRIDE_COL in results.columns else pd.Series('', index=rows.index)
+    applicable = np.where(override == 'Yes', True, np.where(override == 'No', False, per_bill | annual))
+    reason = np.select(
+        [override == 'Yes', override == 'No', per_bill & annual, per_bill, annual],
+        ['Manually marked applicable', 'Manually marked not applicable',
+         'Single transaction exceeds per-bill limit and Total exceeds threshold',
+         'Single transaction exceeds per-bill limit', 'Total exceeds threshold'],
+        default='Below threshold')
+    _assign(results, 'Threshold Breach', pos, np.where(annual, 'Yes', 'No'))
+    _assign(results, 'TDS/TCS Applicable', pos, np.where(applicable, 'Yes', 'No'))
+    _assign(results, 'TDS/TCS Amount', pos, np.where(applicable, (total * rows['Rate'].astype(float) / 100.0).round(2), 0.0))
+    _assign(results, 'Reason', pos, reason)
+    return results
+
+def _write_logged(results, entries, key):
+    """Write logged per-row values back ('new' to replay a batch, inverse entries to undo one)."""
+    touched = set()
+    for e in entries:
+        if e['field'] == 'applicable' and OVERRIDE_COL not in results.columns:
+            results[OVERRIDE_COL] = ''
+        _assign(results, EDIT_COLUMNS[e['field']], e['rows'], e[key])
+        if e['field'] != 'section':
+            touched.update(e['rows'])
+    if touched:
+        recompute_rows(results, sorted(touched))
+    return results
+
+def apply_edits(results, edits):
+    """Apply a batch of party-level edits; returns (results, applied) or raises EditError.
+
+    Each edit is {'party_name', 'field', 'value'} plus an optional 'section'
+    that narrows it to that party's row for the section (as it was before the
+    batch). The batch is validated up front so either every edit is applied
+    or none is.
+    """
+    index = results.groupby('Party Name', sort=False).indices
+    sections = results['Section'].astype(str).to_numpy()
+    parsed, errors, missing = [], [], []
+    for i, e in enumerate(edits):
+        if not isinstance(e, dict) or not isinstance(e.get('party_name'), str):
+            errors.append((i, 'Edit must be an object with a party_name string'))
+            continue
+        party, field, value, section = e['party_name'], e.get('field'), e.get('value'), e.get('section')
+        if field not in EDIT_COLUMNS:
+            errors.append((i, f'Unsupported field {field}'))
+            continue
+        if party not in index:
+            errors.append((i, f'Party {party} not found'))
+            missing.append(i)
+            continue
+        pos = index[party]
+        if section is not None:
+            pos = pos[sections[pos] == str(section)]
+            if not len(pos):
+                errors.append((i, f'Section {section} not found for party {party}'))
+                missing.append(i)
+                continue
+        if field in ('rate', 'threshold'):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = None
+            if value is None or not np.isfinite(value) or value < 0:
+                errors.append((i, f'Invalid {field} value'))
+                continue
+        elif field == 'applicable':
+            value = APPLICABILITY.get(str(value).strip().lower())
+            if value is None:
+                errors.append((i, "applicable must be 'yes', 'no' or 'auto'"))
+                continue
+        else:
+            value = '' if value is None or isinstance(value, (dict, list)) else str(value)
+            if not value.strip():
+                errors.append((i, 'Invalid section value'))
+                continue
+        parsed.append((party, section, field, pos.tolist(), value))
+    if errors:
+        raise EditError(errors, missing)
+
+    applied = []
+    for party, section, field, pos, value in parsed:
+        applied.append({'party_name': party, 'section': section, 'field': field, 'rows': pos,
+                        'old': _row_values(results, EDIT_COLUMNS[field], pos), 'new': [value] * len(pos)})
+    return _write_logged(results, applied, 'new'), applied
+
+def replay_edit_log(results, upload_id):
+    for batch in load_edit_log(upload_id):
+        results = _write_logged(results, batch['edits'], 'new')
+    return results
+
+def log_batch(results, batch):
+    """Store edited results in the session and append the batch to the edit log."""
+    batch = {'id': uuid.uuid4().hex, 'upload_id': session.get('upload_id'),
+             'ts': datetime.now().isoformat(timespec='seconds'), **batch}
+    session['results'] = results.to_json(orient='records')
+    append_edit_log(batch)
+    return batch
+
+def changed_rows(results, batch):
+    rows = sorted({p for e in batch['edits'] for p in e['rows']})
+    return json_lib.loads(results.iloc[rows].to_json(orient='records'))
+
+def commit_edits(edits):
+    """Apply edits to the session results and log them; returns (results, batch)."""
+    results = pd.read_json(io.StringIO(session['results']), orient='records')
+    results, applied = apply_edits(results, edits)
+    return results, log_batch(results, {'edits': applied})
+
 @app.route('/update_entry', methods=['POST'])
 def update_entry():
     try:
@@ -441,30 +616,61 @@ def update_entry():
 
         if 'results' not in session:
             return jsonify({'error': 'No data available'}), 400
-
-        results = pd.read_json(session['results'], orient='records')
-        mask = results['Party Name'] == party
-        if not mask.any():
-            return jsonify({'error': f'Party {party} not found'}), 404
-
-        if field == 'rate':
-            try:
-                new_rate = float(value)
-            except ValueError:
-                return jsonify({'error': 'Invalid rate value'}), 400
-            results.loc[mask, 'Rate'] = new_rate
-            base = results.loc[mask, 'Total Amount'].values[0]
-            results.loc[mask, 'TDS/TCS Amount'] = round(base * new_rate / 100.0, 2)
-        elif field == 'section':
-            results.loc[mask, 'Section'] = str(value)
-        else:
+        if field not in ('rate', 'section'):
             return jsonify({'error': 'Unsupported field'}), 400
+        try:
+            results, batch = commit_edits([{'party_name': party, 'field': field, 'value': value}])
+        except EditError as e:
+            if e.missing or not isinstance(party, str):
+                return jsonify({'error': f'Party {party} not found'}), 404
+            return jsonify({'error': e.errors[0][1]}), 400
+
+        return jsonify({'success': True, 'message': f'Updated {field} for {party}', 'new_value': value,
+                        'results': changed_rows(results, batch)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        session['results'] = results.to_json(orient='records')
-        # Update persisted results as well
-        with open(PERSIST_RESULTS, 'w', encoding='utf-8') as f: f.write(results.to_json(orient='records'))
+@app.route('/update_entries', methods=['POST'])
+def update_entries():
+    try:
+        data = request.get_json(silent=True)
+        edits = data.get('edits') if isinstance(data, dict) else None
+        if not isinstance(edits, list) or not edits:
+            return jsonify({'error': 'No edits supplied'}), 400
+        if 'results' not in session:
+            return jsonify({'error': 'No data available'}), 400
+        try:
+            results, batch = commit_edits(edits)
+        except EditError as e:
+            return jsonify({'error': str(e)}), 400
 
-        return jsonify({'success': True, 'message': f'Updated {field} for {party}', 'new_value': value})
+        parties = {e['party_name'] for e in batch['edits']}
+        return jsonify({
+            'success': True,
+            'message': f"Applied {len(batch['edits'])} edits to {len(parties)} parties",
+            'batch_id': batch['id'],
+            'results': changed_rows(results, batch)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/undo_edits', methods=['POST'])
+def undo_edits():
+    try:
+        if 'results' not in session:
+            return jsonify({'error': 'No data available'}), 400
+        batches = load_edit_log(session.get('upload_id'))
+        undone = {b['undo_of'] for b in batches if b.get('undo_of')}
+        last = next((b for b in reversed(batches) if not b.get('undo_of') and b['id'] not in undone), None)
+        if last is None:
+            return jsonify({'error': 'Nothing to undo'}), 400
+
+        results = pd.read_json(io.StringIO(session['results']), orient='records')
+        inverse = [{**e, 'old': _row_values(results, EDIT_COLUMNS[e['field']], e['rows']), 'new': e['old']}
+                   for e in reversed(last['edits'])]
+        results = _write_logged(results, inverse, 'new')
+        batch = log_batch(results, {'undo_of': last['id'], 'edits': inverse})
+        return jsonify({'success': True, 'message': f"Undid edit batch {last['id']}", 'batch_id': batch['id']})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -483,10 +689,10 @@ def download(format):
             # Fallback to persisted data if session is empty
             if not (os.path.exists(PERSIST_RESULTS) and os.path.exists(PERSIST_ORIG)):
                 return jsonify({'error': 'No data available. Please upload and analyze a file first.'}), 400
-            results = pd.read_json(PERSIST_RESULTS, orient='records')
+            meta = json_lib.load(open(PERSIST_META, 'r', encoding='utf-8')) if os.path.exists(PERSIST_META) else {}
+            results = replay_edit_log(pd.read_json(PERSIST_RESULTS, orient='records'), meta.get('upload_id'))
             original = pd.read_json(PERSIST_ORIG, orient='records')
             tx_detail = pd.read_json(PERSIST_TXN, orient='records') if os.path.exists(PERSIST_TXN) else pd.DataFrame()
-            meta = json_lib.load(open(PERSIST_META, 'r', encoding='utf-8')) if os.path.exists(PERSIST_META) else {}
             total_amount = meta.get('total_amount', float(original['Amount'].sum()) if 'Amount' in original.columns else 0.0)
 
         if tx_detail.empty:
@@ -541,6 +747,7 @@ def _debug_session():
             'original': os.path.exists(PERSIST_ORIG),
             'transactions': os.path.exists(PERSIST_TXN),
             'meta': os.path.exists(PERSIST_META),
+            'edits': os.path.exists(PERSIST_EDITS),
         }
     })
 
@@ -555,7 +762,7 @@ if __name__ == '__main__':
     print("Features:")
     print("  ✓ Upload Excel & PDF")
     print("  ✓ Custom Rules Manager (Add/Update/Delete)")
-    print("  ✓ Edit rates/sections inline")
+    print("  ✓ Edit rates/sections/thresholds inline (single or batch, with undo)")
     print("  ✓ Export Excel (5 sheets) + CSV")
     print("  ✓ Persistent fallback for downloads")
     print("=" * 80)
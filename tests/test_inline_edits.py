@@ -0,0 +1,184 @@
+import io
+
+import pandas as pd
+import pytest
+
+import tds_web_app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for name, fname in [('PERSIST_RESULTS', 'results.json'), ('PERSIST_ORIG', 'original_data.json'),
+                        ('PERSIST_TXN', 'transactions_detail.json'), ('PERSIST_META', 'meta.json'),
+                        ('PERSIST_EDITS', 'edits.jsonl')]:
+        monkeypatch.setattr(tds_web_app, name, str(tmp_path / fname))
+    monkeypatch.setattr(tds_web_app, 'CUSTOM_RULES_FILE', str(tmp_path / 'custom_rules.json'))
+    tds_web_app.app.config['TESTING'] = True
+    return tds_web_app.app.test_client()
+
+
+def upload(client, rows):
+    buf = io.BytesIO()
+    pd.DataFrame(rows, columns=['Date', 'Debit Ledger', 'Credit Ledger', 'Amount']).to_excel(buf, index=False)
+    buf.seek(0)
+    resp = client.post('/upload', data={'file': (buf, 'ledger.xlsx')}, content_type='multipart/form-data')
+    assert resp.status_code == 200
+    return resp
+
+
+def session_results(client):
+    with client.session_transaction() as sess:
+        return pd.read_json(io.StringIO(sess['results']), orient='records')
+
+
+def row(results, party, section=None):
+    mask = results['Party Name'] == party
+    if section is not None:
+        mask &= results['Section'] == section
+    return results.loc[mask].iloc[0]
+
+
+LEDGER = [
+    ('2024-04-01', 'Rent Expense', 'ABC office rent', 300000),
+    ('2024-04-02', 'Fees', 'XYZ professional', 50000),
+    ('2024-04-03', 'Fees', 'Small consulting', 1000),
+]
+
+
+def test_batch_is_all_or_nothing(client):
+    upload(client, LEDGER)
+    resp = client.post('/update_entries', json={'edits': [
+        {'party_name': 'XYZ professional', 'field': 'rate', 'value': 5},
+        {'party_name': 'Nobody', 'field': 'rate', 'value': 5},
+    ]})
+    assert resp.status_code == 400
+    assert row(session_results(client), 'XYZ professional')['Rate'] == 10
+
+    resp = client.post('/update_entries', json={'edits': [
+        {'party_name': 'XYZ professional', 'field': 'rate', 'value': 5},
+        {'party_name': 'ABC office rent', 'field': 'threshold', 'value': 400000},
+    ]})
+    assert resp.status_code == 200
+    results = session_results(client)
+    assert row(results, 'XYZ professional')['TDS/TCS Amount'] == 2500
+    rent = row(results, 'ABC office rent')
+    assert rent['TDS/TCS Applicable'] == 'No' and rent['TDS/TCS Amount'] == 0
+
+
+def test_fractional_rate(client):
+    upload(client, LEDGER)
+    resp = client.post('/update_entries', json={'edits': [{'party_name': 'XYZ professional', 'field': 'rate', 'value': '1.5'}]})
+    assert resp.status_code == 200
+    assert row(session_results(client), 'XYZ professional')['TDS/TCS Amount'] == 750
+
+
+def test_multi_section_party_undo(client):
+    # Same ledger is a 194J payee (credit side) and a 206C(1) buyer (debit side)
+    upload(client, [
+        ('2024-04-01', 'Fees', 'Scrap professional', 50000),
+        ('2024-04-02', 'Scrap professional', 'Bank', 10000),
+    ])
+    before = session_results(client)
+    assert sorted(before['Section']) == ['194J', '206C(1)']
+
+    assert client.post('/update_entries', json={'edits': [
+        {'party_name': 'Scrap professional', 'field': 'rate', 'value': 2},
+        {'party_name': 'Scrap professional', 'section': '194J', 'field': 'section', 'value': '194JB'},
+    ]}).status_code == 200
+    edited = session_results(client)
+    assert set(edited['Rate']) == {2}
+    assert sorted(edited['Section']) == ['194JB', '206C(1)']
+
+    assert client.post('/undo_edits').status_code == 200
+    pd.testing.assert_frame_equal(session_results(client)[before.columns], before, check_dtype=False)
+    assert client.post('/undo_edits').status_code == 400
+
+
+def test_auto_override_replays_on_fallback_download(client):
+    upload(client, LEDGER)
+    for value in ('yes', 'auto', 'no'):
+        resp = client.post('/update_entries', json={'edits': [
+            {'party_name': 'Small consulting', 'field': 'applicable', 'value': value}]})
+        assert resp.status_code == 200
+    assert client.post('/undo_edits').status_code == 200
+    expected = session_results(client)
+    assert row(expected, 'Small consulting')['TDS/TCS Applicable'] == 'No'
+
+    with client.session_transaction() as sess:
+        sess.clear()
+    resp = client.get('/download/csv')
+    assert resp.status_code == 200
+    exported = pd.read_csv(io.BytesIO(resp.data))
+    assert list(exported['TDS/TCS Applicable']) == list(expected['TDS/TCS Applicable'])
+    assert list(exported['TDS/TCS Amount']) == list(expected['TDS/TCS Amount'])
+
+
+@pytest.mark.parametrize('payload', [
+    {'edits': ['rate']},
+    {'edits': [{'party_name': ['XYZ professional'], 'field': 'rate', 'value': 5}]},
+    {'edits': [{'party_name': 'XYZ professional', 'field': 'rate', 'value': 'nan'}]},
+    {'edits': [{'party_name': 'XYZ professional', 'field': 'threshold', 'value': 'inf'}]},
+    {'edits': [{'party_name': 'XYZ professional', 'field': 'applicable', 'value': 'maybe'}]},
+    {'edits': [{'party_name': 'XYZ professional', 'field': 'colour', 'value': 'red'}]},
+    {'edits': []},
+    ['not', 'an', 'object'],
+])
+def test_malformed_payloads_return_400(client, payload):
+    upload(client, LEDGER)
+    assert client.post('/update_entries', json=payload).status_code == 400
+    assert row(session_results(client), 'XYZ professional')['Rate'] == 10
+
+
+def test_update_entry_keeps_single_edit_contract(client):
+    upload(client, LEDGER)
+    resp = client.post('/update_entry', json={'party_name': 'Nobody', 'field': 'rate', 'value': '2'})
+    assert resp.status_code == 404 and resp.json['error'] == 'Party Nobody not found'
+    resp = client.post('/update_entry', json={'party_name': 'XYZ professional', 'field': 'rate', 'value': 'abc'})
+    assert resp.status_code == 400 and resp.json['error'] == 'Invalid rate value'
+    resp = client.post('/update_entry', json={'party_name': 'XYZ professional', 'field': 'threshold', 'value': '1'})
+    assert resp.status_code == 400
+    resp = client.post('/update_entry', json={'party_name': 'XYZ professional', 'field': 'rate', 'value': '0.1'})
+    assert resp.status_code == 200
+    assert row(session_results(client), 'XYZ professional')['TDS/TCS Amount'] == 50
+
+
+def test_update_entry_returns_recomputed_rows(client):
+    upload(client, LEDGER)
+    resp = client.post('/update_entry', json={'party_name': 'Small consulting', 'field': 'rate', 'value': '5'})
+    assert resp.status_code == 200
+    [updated] = resp.json['results']
+    stored = row(session_results(client), 'Small consulting')
+    assert updated['TDS/TCS Applicable'] == stored['TDS/TCS Applicable'] == 'No'
+    assert updated['TDS/TCS Amount'] == stored['TDS/TCS Amount'] == 0
+    assert updated['Rate'] == 5
+
+
+def test_update_entry_accepts_numeric_section(client):
+    upload(client, LEDGER)
+    resp = client.post('/update_entry', json={'party_name': 'XYZ professional', 'field': 'section', 'value': 194})
+    assert resp.status_code == 200
+    assert str(row(session_results(client), 'XYZ professional')['Section']) == '194'
+    resp = client.post('/update_entry', json={'party_name': 'XYZ professional', 'field': 'section', 'value': '  '})
+    assert resp.status_code == 400
+
+
+def test_broken_edit_log_line_is_skipped(client):
+    upload(client, LEDGER)
+    assert client.post('/update_entries', json={'edits': [
+        {'party_name': 'XYZ professional', 'field': 'rate', 'value': 5}]}).status_code == 200
+    with open(tds_web_app.PERSIST_EDITS, 'a', encoding='utf-8') as f:
+        f.write('{"id": "half-written", "edits": [{"party_na')
+    assert client.post('/update_entries', json={'edits': [
+        {'party_name': 'ABC office rent', 'field': 'rate', 'value': 2}]}).status_code == 200
+
+    with client.session_transaction() as sess:
+        upload_id = sess['upload_id']
+    assert client.post('/undo_edits').status_code == 200
+    with client.session_transaction() as sess:
+        sess.clear()
+    resp = client.get('/download/csv')
+    assert resp.status_code == 200
+    exported = pd.read_csv(io.BytesIO(resp.data))
+    assert row(exported, 'XYZ professional')['TDS/TCS Amount'] == 2500
+    assert row(exported, 'ABC office rent')['Rate'] == 10
+    assert len(tds_web_app.load_edit_log(upload_id)) == 3